@@ -1,8 +1,21 @@
 import streamlit as st
-import pandas as pd
-import random
+import numpy as np
+import heapq
+from calendar import monthrange
 from datetime import datetime
 
+try:
+    import pulp
+except ImportError:
+    pulp = None
+
+# numba is optional; without it the assignment loop runs as plain Python
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda func: func
+
 # List of public holidays in Slovakia
 public_holidays = {
     1: ["01-01", "01-06"],
@@ -15,6 +28,11 @@ public_holidays = {
     12: ["12-24", "12-25", "12-26"]
 }
 
+# Widget options, built once instead of on every rerun
+_DAYS_1_31 = tuple(range(1, 32))
+_MONTHS = tuple(range(1, 13))
+
+@st.cache_data
 def get_public_holidays(year):
     holidays = []
     for month, days in public_holidays.items():
@@ -26,86 +44,235 @@ def validate_days(days, num_days):
     return [day for day in days if day <= num_days]
 
 def generate_initial_schedule(doctors, month, year):
-    num_days = (pd.Timestamp(year=year, month=month, day=1) + pd.offsets.MonthEnd(0)).day
-    schedule = {day: [] for day in range(1, num_days + 1)}
-
-    # Assign doctors to their wanted days, ensuring mutual exclusivity with excluded days
-    for doctor, details in doctors.items():
-        validated_wanted_days = validate_days(details['wanted_days'], num_days)
-        for day in validated_wanted_days:
-            if day not in details['excluded_days']:
-                schedule[day].append(doctor)
-
-    return schedule
-
-def identify_conflicts(schedule):
-    conflicts = {day: doctors for day, doctors in schedule.items() if len(doctors) > 1}
-    return conflicts
+    """Return a doctors x (days + 1) uint8 wanted-day matrix (rows in doctors order) and the conflicts."""
+    num_days = monthrange(year, month)[1]
+    names = list(doctors)
+    want = np.zeros((len(names), num_days + 1), dtype=np.uint8)
+
+    # Mark wanted days, ensuring mutual exclusivity with excluded days
+    for i, details in enumerate(doctors.values()):
+        want[i, validate_days(details['wanted_days'], num_days)] = 1
+        want[i, validate_days(details['excluded_days'], num_days)] = 0
+
+    # Days wanted by more than one doctor, in calendar order
+    conflicts = {
+        int(day): [names[i] for i in np.flatnonzero(want[:, day])]
+        for day in np.flatnonzero(want.sum(axis=0) > 1)
+    }
+    return want, conflicts
 
 def resolve_conflicts(conflicts):
     resolved_schedule = {}
 
+    # The selectbox key keeps each choice across reruns; no separate session_state copy is needed
     for day, doctors_list in conflicts.items():
-        if f"conflict_{day}" not in st.session_state:
-            st.session_state[f"conflict_{day}"] = doctors_list[0]
-
         selected_doctor = st.selectbox(
             f"Resolve conflict for day {day}:", 
             doctors_list, 
-            key=f"conflict_{day}", 
-            index=doctors_list.index(st.session_state[f"conflict_{day}"])
+            key=f"conflict_{day}"
         )
         resolved_schedule[day] = selected_doctor
 
     return resolved_schedule
 
-def finalize_schedule(schedule, resolved_schedule, doctors):
-    final_schedule = {}
-    doctor_shift_count = {doctor: 0 for doctor in doctors.keys()}
-
-    # Apply resolved conflicts and ensure no consecutive shifts
-    for day, assigned_doctors in schedule.items():
-        if day in resolved_schedule:
-            final_schedule[day] = resolved_schedule[day]
-            doctor_shift_count[resolved_schedule[day]] += 1
-        elif len(assigned_doctors) == 1:
-            final_schedule[day] = assigned_doctors[0]
-            doctor_shift_count[assigned_doctors[0]] += 1
+def solve_schedule_ilp(preferred, num_days, excluded_sets, num_shifts_cap):
+    """Assign every day in one CBC solve; returns None if no schedule was found."""
+    days = range(1, num_days + 1)
+    prob = pulp.LpProblem("shifts", pulp.LpMinimize)
+
+    # One binary variable per allowed (doctor, day) pair; excluded days never get one
+    x = {
+        (doctor, day): pulp.LpVariable(f"x_{i}_{day}", cat="Binary")
+        for i, doctor in enumerate(excluded_sets)
+        for day in days
+        if day not in excluded_sets[doctor]
+    }
+
+    # At most one doctor per day (a day stays empty only when nobody can take it)
+    for day in days:
+        prob += pulp.lpSum(x[doctor, day] for doctor in excluded_sets if (doctor, day) in x) <= 1
+
+    max_shifts = pulp.LpVariable("max_shifts", lowBound=0)
+    min_shifts = pulp.LpVariable("min_shifts", lowBound=0)
+    for doctor, cap in num_shifts_cap.items():
+        shifts = pulp.lpSum(x[doctor, day] for day in days if (doctor, day) in x)
+        if cap != float('inf'):
+            prob += shifts <= cap
+        prob += shifts <= max_shifts
+        prob += shifts >= min_shifts
+
+        # No consecutive shifts
+        for day in range(1, num_days):
+            if (doctor, day) in x and (doctor, day + 1) in x:
+                prob += x[doctor, day] + x[doctor, day + 1] <= 1
+
+    # Filling a day outweighs honouring a wish, which outweighs perfect balance
+    prob += pulp.lpSum(
+        (-100 - (10 if preferred.get(day) == doctor else 0)) * var
+        for (doctor, day), var in x.items()
+    ) + (max_shifts - min_shifts)
+
+    # The objective is integral, so any gap below 1 already proves optimality
+    prob.solve(pulp.PULP_CBC_CMD(msg=0, timeLimit=10, gapAbs=0.99))
+    if prob.sol_status not in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible):
+        return None
+
+    final_schedule = {day: None for day in days}
+    for (doctor, day), var in x.items():
+        if var.value() is not None and var.value() > 0.5:
+            final_schedule[day] = doctor
+    return final_schedule
+
+@njit(cache=True)
+def pop_least_loaded(heap, excluded, caps, day, prev_doc, next_doc):
+    """Pop the least-loaded doctor allowed on day; doctors skipped for this day are pushed back."""
+    skipped = []
+    best = -1
+    while heap:
+        count, doctor = heapq.heappop(heap)
+        if count >= caps[doctor]:
+            continue  # Counts only grow, so a capped doctor is dropped for good
+        if not excluded[doctor, day] and doctor != prev_doc and doctor != next_doc:
+            best = doctor
+            break
+        skipped.append((count, doctor))
+
+    for entry in skipped:
+        heapq.heappush(heap, entry)
+    return best
+
+@njit(cache=True)
+def assign_remaining_shifts(excluded, caps, wanted, prev_assigned):
+    """Fill unassigned days (-1) with the least-loaded allowed doctor, preferring wanted days.
+
+    With more than 8 doctors the pick comes from a (shift count, doctor) min-heap instead of a
+    scan over all doctors; ties then go to the lower doctor index rather than to wanted days.
+    """
+    num_doctors = excluded.shape[0]
+    num_days = excluded.shape[1] - 1
+    assigned = prev_assigned.copy()
+    counts = np.zeros(num_doctors, dtype=np.int32)
+    for day in range(1, num_days + 1):
+        if assigned[day] >= 0:
+            counts[assigned[day]] += 1
+
+    use_heap = num_doctors > 8
+    heap = [(np.int64(counts[doctor]), np.int64(doctor)) for doctor in range(num_doctors)]
+    heapq.heapify(heap)
+
+    for day in range(1, num_days + 1):
+        if assigned[day] >= 0:
+            continue
+        # Neighbouring assignments are the same for every candidate, so read them once
+        prev_doc = assigned[day - 1] if day > 1 else -1
+        next_doc = assigned[day + 1] if day < num_days else -1
+        if use_heap:
+            best = pop_least_loaded(heap, excluded, caps, day, prev_doc, next_doc)
         else:
-            final_schedule[day] = None
-
-    # Distribute remaining shifts fairly, ensuring no consecutive days and respecting excluded days
-    for day in range(1, len(final_schedule) + 1):
-        if final_schedule[day] is None:  # If no doctor is assigned
-            available_doctors = [
-                doctor for doctor, count in doctor_shift_count.items()
-                if doctors[doctor].get('num_shifts', float('inf')) > count
-                and day not in doctors[doctor]['excluded_days']  # Respect excluded days
-                and (day == 1 or final_schedule[day - 1] != doctor)
-                and (day == len(final_schedule) or final_schedule[day + 1] != doctor)
-            ]
-            if available_doctors:
-                selected_doctor = random.choice(available_doctors)
-                final_schedule[day] = selected_doctor
-                doctor_shift_count[selected_doctor] += 1
-
-    # Ensure no doctor is scheduled on consecutive days
-    for day in range(2, len(final_schedule)):
-        if final_schedule[day] == final_schedule[day - 1]:
-            final_schedule[day] = None  # Unassign this day to avoid consecutive shifts
+            best = -1
+            for doctor in range(num_doctors):
+                if (counts[doctor] < caps[doctor]
+                        and not excluded[doctor, day]
+                        and doctor != prev_doc
+                        and doctor != next_doc):
+                    if (best < 0 or counts[doctor] < counts[best]
+                            or (counts[doctor] == counts[best] and wanted[doctor, day] > wanted[best, day])):
+                        best = doctor
+        if best >= 0:
+            assigned[day] = best
+            counts[best] += 1
+            if use_heap:
+                heapq.heappush(heap, (np.int64(counts[best]), np.int64(best)))
+
+    return assigned
+
+def finalize_schedule(want, resolved_schedule, doctors):
+    names = list(doctors)
+    num_days = want.shape[1] - 1
+    excluded_sets = {doctor: set(info['excluded_days']) for doctor, info in doctors.items()}
+    num_shifts_cap = {doctor: info.get('num_shifts', float('inf')) for doctor, info in doctors.items()}
+
+    # Preferred doctor per day: the resolved conflict or the only doctor who wanted it
+    sole_wanted_days = np.flatnonzero(want.sum(axis=0) == 1)
+    preferred = {int(day): names[want[:, day].argmax()] for day in sole_wanted_days}
+    preferred.update(resolved_schedule)
+
+    if pulp is not None and doctors:
+        final_schedule = solve_schedule_ilp(preferred, num_days, excluded_sets, num_shifts_cap)
+        if final_schedule is not None:
+            return final_schedule
+
+    # Apply resolved conflicts and sole wanted days, leaving a day open rather than
+    # giving a doctor two nights in a row
+    final_schedule = {}
+    for day in range(1, num_days + 1):
+        doctor = preferred.get(day)
+        final_schedule[day] = doctor if doctor != final_schedule.get(day - 1) else None
+
+    # Distribute remaining shifts fairly on doctor-ID-indexed arrays
+    doc_ids = {doctor: i for i, doctor in enumerate(names)}
+    excluded = np.zeros((len(names), num_days + 1), dtype=np.uint8)
+    caps = np.empty(len(names), dtype=np.int32)
+    for i, doctor in enumerate(names):
+        excluded[i, validate_days(excluded_sets[doctor], num_days)] = 1
+        caps[i] = min(num_shifts_cap[doctor], num_days)
+
+    prev_assigned = np.full(num_days + 1, -1, dtype=np.int32)
+    for day, doctor in final_schedule.items():
+        if doctor is not None:
+            prev_assigned[day] = doc_ids[doctor]
+
+    assigned = assign_remaining_shifts(excluded, caps, want, prev_assigned)
+    for day in range(1, num_days + 1):
+        final_schedule[day] = names[assigned[day]] if assigned[day] >= 0 else None
 
     return final_schedule
 
-def is_weekend_or_holiday(date_str, holidays):
-    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-    is_weekend = date_obj.weekday() >= 5
-    is_holiday = date_str in holidays
-    return is_weekend or is_holiday
+def freeze_doctors(doctors):
+    """Convert the doctors dict into the hashable tuple form taken by compute_schedule."""
+    return tuple(
+        (name, tuple(info['excluded_days']), tuple(info['wanted_days']), info['num_shifts'])
+        for name, info in doctors.items()
+    )
+
+@st.cache_data
+def compute_schedule(doctors_tuple, month, year, resolved=None):
+    """Run the whole scheduling pipeline without any widgets; usable headless or from a batch job.
+
+    doctors_tuple comes from freeze_doctors and resolved is a tuple of (day, doctor) pairs.
+    Returns (final_schedule, conflicts); final_schedule is None while conflicts are unresolved.
+    """
+    doctors = {
+        name: {"excluded_days": list(excluded), "wanted_days": list(wanted), "num_shifts": num_shifts}
+        for name, excluded, wanted, num_shifts in doctors_tuple
+    }
+    want, conflicts = generate_initial_schedule(doctors, month, year)
+    if conflicts and resolved is None:
+        return None, conflicts
+
+    return finalize_schedule(want, dict(resolved or ()), doctors), conflicts
+
+@st.cache_data
+def build_schedule_df(final_schedule_items, first_wd, holiday_days):
+    """Render table for a finalized month, keyed on hashable inputs so unchanged reruns hit the cache."""
+    num_days = len(final_schedule_items)
+
+    # Weekday follows from the month's first weekday, so no dates need to be parsed
+    days = np.arange(1, num_days + 1)
+    special_days = ((first_wd + days - 1) % 7 >= 5) | np.isin(days, list(holiday_days))
+    day_labels = days.astype(str)
+    date_col = np.where(special_days, np.char.add(np.char.add("**", day_labels), "**"), day_labels)
+    doctor_col = [doctor or "None" for _, doctor in final_schedule_items]
+
+    # pandas is only needed for the table, so keep it off the app's cold-start path
+    import pandas as pd
+
+    return pd.DataFrame({"Doctor": doctor_col}, index=pd.Index(date_col, name="Date"))
 
 def reset_scheduling_process():
-    for key in list(st.session_state.keys()):
-        if key.startswith("conflict_") or key in ["initial_schedule", "conflicts", "final_schedule"]:
-            del st.session_state[key]
+    # Conflict selectboxes are no longer rendered after this, so Streamlit drops their widget state itself
+    for key in ("conflicts", "final_schedule"):
+        st.session_state.pop(key, None)
 
 def main():
     st.set_page_config(layout="wide")
@@ -118,18 +285,20 @@ def main():
     year_range = list(range(today.year, today.year + 10))
 
     selected_year = st.selectbox("Year", year_range, index=year_range.index(st.session_state.get("selected_year", today.year)), on_change=reset_scheduling_process)
-    selected_month = st.selectbox("Month", list(range(1, 13)), index=(st.session_state.get("selected_month", today.month) - 1), on_change=reset_scheduling_process)
+    selected_month = st.selectbox("Month", _MONTHS, index=(st.session_state.get("selected_month", today.month) - 1), on_change=reset_scheduling_process)
 
     st.session_state["selected_year"] = selected_year
     st.session_state["selected_month"] = selected_month
 
+    first_wd, num_days = monthrange(selected_year, selected_month)
+
     if "doctors" not in st.session_state:
         st.session_state["doctors"] = {}
 
     with st.form("doctor_input_form", clear_on_submit=True):
         name = st.text_input("Doctor's Name:")
-        excluded_days = st.multiselect("Excluded Days:", list(range(1, 32)))
-        wanted_days = st.multiselect("Wanted Days:", list(range(1, 32)))
+        excluded_days = st.multiselect("Excluded Days:", _DAYS_1_31[:num_days])
+        wanted_days = st.multiselect("Wanted Days:", _DAYS_1_31[:num_days])
         num_shifts = st.number_input("Maximum Number of Night Shifts:", min_value=0, max_value=31, step=1)
         add_doctor = st.form_submit_button("Add Doctor")
 
@@ -151,16 +320,16 @@ def main():
 
     if selected_year and selected_month:
         holidays = get_public_holidays(selected_year)
+        holiday_days = frozenset(int(h[-2:]) for h in holidays if int(h[5:7]) == selected_month)
 
         if st.button("Generate Schedule"):
             st.write("Generating initial schedule...")  # Debugging: Check status
-            st.session_state["initial_schedule"] = generate_initial_schedule(st.session_state["doctors"], selected_month, selected_year)
-            st.session_state["conflicts"] = identify_conflicts(st.session_state["initial_schedule"])
+            final_schedule, st.session_state["conflicts"] = compute_schedule(freeze_doctors(st.session_state["doctors"]), selected_month, selected_year)
 
-            # Automatically finalize schedule if there are no conflicts
-            if not st.session_state["conflicts"]:
+            # The schedule is finalized automatically if there are no conflicts
+            if final_schedule is not None:
                 st.write("Finalizing schedule...")  # Debugging: Check status
-                st.session_state["final_schedule"] = finalize_schedule(st.session_state["initial_schedule"], {}, st.session_state["doctors"])
+                st.session_state["final_schedule"] = final_schedule
 
         if "conflicts" in st.session_state and st.session_state["conflicts"]:
             st.write("### Conflict Resolution")
@@ -168,21 +337,15 @@ def main():
 
             if st.button("Finalize Schedule"):
                 st.write("Finalizing schedule after conflict resolution...")  # Debugging: Check status
-                st.session_state["final_schedule"] = finalize_schedule(st.session_state["initial_schedule"], resolved_schedule, st.session_state["doctors"])
+                resolved = tuple(sorted(resolved_schedule.items()))
+                st.session_state["final_schedule"], _ = compute_schedule(freeze_doctors(st.session_state["doctors"]), selected_month, selected_year, resolved)
 
         if "final_schedule" in st.session_state:
             st.write("### Final Night Shift Schedule")
-            schedule_data = []
-
-            final_schedule = st.session_state["final_schedule"]
-
-            for day in range(1, len(final_schedule) + 1):
-                date_str = f"{selected_year}-{selected_month:02d}-{day:02d}"
-                day_display = f"**{day}**" if is_weekend_or_holiday(date_str, holidays) else str(day)
-                schedule_data.append({"Date": day_display, "Doctor": final_schedule[day] if final_schedule[day] else "None"})
 
-            df_schedule = pd.DataFrame(schedule_data)
-            st.dataframe(df_schedule.set_index("Date"))
+            final_schedule_items = tuple(sorted(st.session_state["final_schedule"].items()))
+            df_schedule = build_schedule_df(final_schedule_items, first_wd, holiday_days)
+            st.dataframe(df_schedule, key="final_schedule_grid")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file